@@ -1,8 +1,80 @@
 import numpy as np
-from typing import Any, Callable, Iterable
-from math import factorial
-from itertools import chain, combinations
-from copy import deepcopy
+from typing import Any, Callable, Iterator
+from math import comb, factorial
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import is_regressor
+from sklearn.linear_model import (
+    ARDRegression,
+    BayesianRidge,
+    ElasticNet,
+    ElasticNetCV,
+    HuberRegressor,
+    Lars,
+    Lasso,
+    LassoCV,
+    LinearRegression,
+    Ridge,
+    RidgeCV,
+    SGDRegressor,
+    TheilSenRegressor,
+)
+
+# Regressors whose `predict` is x @ coef_ + intercept_ (subclasses such as LassoLars included).
+LINEAR_REGRESSORS = (
+    ARDRegression,
+    BayesianRidge,
+    ElasticNet,
+    ElasticNetCV,
+    HuberRegressor,
+    Lars,
+    Lasso,
+    LassoCV,
+    LinearRegression,
+    Ridge,
+    RidgeCV,
+    SGDRegressor,
+    TheilSenRegressor,
+)
+
+try:
+    import numba
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(parallel=True, cache=True)
+    def _fill_masked(
+        background: np.ndarray, instances: np.ndarray, masks: np.ndarray, out: np.ndarray
+    ) -> None:
+        """Write the masked copies of the background for every instance and coalition.
+
+        Sets out[i, k, r, j] = instances[i, j] if masks[k, j] else background[r, j],
+        running the (instance, coalition) blocks in parallel.
+
+        Args:
+            background (np.ndarray):
+                Background dataset, shape (n_background, n_features).
+            instances (np.ndarray):
+                Instances, shape (n_instances, n_features).
+            masks (np.ndarray):
+                Boolean coalition-membership matrix, shape (n_coalitions, n_features).
+            out (np.ndarray):
+                Output buffer, shape (n_instances, n_coalitions, n_background, n_features).
+        """
+        n_instances = instances.shape[0]
+        n_coalitions = masks.shape[0]
+        n_background, n_features = background.shape
+        for block in prange(n_instances * n_coalitions):
+            i = block // n_coalitions
+            k = block % n_coalitions
+            for r in range(n_background):
+                for j in range(n_features):
+                    out[i, k, r, j] = instances[i, j] if masks[k, j] else background[r, j]
+
 
 class ShapleyExplainer:
     """Shapley Values implementation from scratch.
@@ -19,9 +91,27 @@ class ShapleyExplainer:
         background_dataset (np.ndarray):
             Background dataset used for estimating feature contributions.
             Typically a representative sample of the input data.
+        dtype (np.dtype):
+            Floating point type of the masked inputs passed to the model.
+        batch_size (int | None):
+            Number of coalitions evaluated per model call (None to derive it
+            from `max_memory_bytes`).
+        max_memory_bytes (int):
+            Target size of the masked input of a single model call.
+        device (str | None):
+            PyTorch device on which the exact method builds its masked inputs
+            (None to use NumPy).
     """
 
-    def __init__(self, model: Callable[[np.ndarray], np.ndarray], background_dataset: np.ndarray) -> None:
+    def __init__(
+        self,
+        model: Callable[[np.ndarray], np.ndarray],
+        background_dataset: np.ndarray,
+        dtype: np.dtype = np.float32,
+        batch_size: int | None = None,
+        max_memory_bytes: int = 1 << 28,
+        device: str | None = None,
+    ) -> None:
         """Initializes the Shapley explainer.
 
         Args:
@@ -30,116 +120,396 @@ class ShapleyExplainer:
             background_dataset (np.ndarray):
                 The dataset used as a background reference for computing Shapley values.
                 Shape should be (n_background, n_features).
+            dtype (np.dtype):
+                Floating point type of the masked copies of the background fed
+                to the model. float32 halves the memory traffic of building
+                them; pass np.float64 if the model needs double precision.
+            batch_size (int | None):
+                Positive number of coalitions evaluated per model call. Evaluating all of
+                them at once needs n_coalitions * n_background * n_features values
+                per instance, so they are streamed in batches. If None, the batch
+                size is chosen so that each model input stays under `max_memory_bytes`.
+            max_memory_bytes (int):
+                Target size in bytes of the masked input of a single model call.
+                The exact method explains the instances in chunks of at most
+                max_memory_bytes // background_dataset.nbytes instances (at least
+                one), so the input size does not grow with the number of
+                instances; the coalition batch is then sized to fit the budget
+                unless `batch_size` is set.
+            device (str | None):
+                PyTorch device (e.g. "cuda") for models that run on it. With a
+                device, the exact method builds the masked inputs on the device
+                and passes them to the model as tensors, so nothing is copied
+                back to the host until the final Shapley values. Requires PyTorch.
         """
-        # TODO: Store `model` and `background_dataset` on `self`.
         self.model = model
-        self.background_dataset = background_dataset
+        self.dtype = np.dtype(dtype)
+        self.background_dataset = np.ascontiguousarray(background_dataset, dtype=self.dtype)
+        if batch_size is not None and batch_size < 1:
+            raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+        self.batch_size = batch_size
+        self.max_memory_bytes = max_memory_bytes
+        self.device = device
+        # Estimator behind `model` when it is the `predict` of a model with a
+        # faster exact algorithm (see `_linear_shap` and `_tree_shap`).
+        estimator = getattr(model, "__self__", None)
+        is_predict = getattr(model, "__name__", None) == "predict" and is_regressor(estimator)
+        self._linear_estimator = (
+            estimator
+            if is_predict and isinstance(estimator, LINEAR_REGRESSORS) and np.ndim(estimator.coef_) == 1
+            else None
+        )
+        self._tree_estimator = (
+            estimator
+            if is_predict and (hasattr(estimator, "get_booster") or hasattr(estimator, "booster_"))
+            else None
+        )
+        # E[f(X)] over the background, i.e. v(∅) for every instance (once per call).
+        self._v_empty: float | None = None
+        # Coalition tables of the exact method, cached by number of features (see `_enum`).
+        self._enum_cache: dict[int, dict[str, np.ndarray]] = {}
 
-    def shapley_values(self, X: np.ndarray) -> np.ndarray:
+    def shapley_values(
+        self,
+        X: np.ndarray,
+        method: str = "exact",
+        n_samples: int = 2048,
+        random_state: int | None = None,
+        n_jobs: int = 1,
+    ) -> np.ndarray:
         """Compute Shapley values for each instance and feature.
 
+        With `method="exact"` every coalition is enumerated, and the coalitions
+        of all the instances are evaluated jointly, in as few model calls as
+        the memory budget allows (see `_iter_coalition_values`). This costs
+        2^n_features coalitions per instance, so for more than ~12 features use
+        one of the sampling methods: `method="kernel"` estimates the values
+        with KernelSHAP from `n_samples` coalitions, and `method="permutation"`
+        averages the marginal contributions along `n_samples` random feature
+        orderings.
+
+        If `model` is the `predict` of a scikit-learn linear regressor, the
+        values are computed in closed form whatever the method. For XGBoost and
+        LightGBM regressors, `method="tree"` uses their TreeSHAP implementation;
+        note that it explains the model with respect to the training data
+        distribution stored in the trees, not the background dataset.
+
+        Instances are independent, so with `n_jobs != 1` they are split into
+        blocks that are explained in parallel with joblib. Keep `n_jobs=1` if
+        the model's predict is already multi-threaded. The numba threads that
+        build the masked inputs are split between the jobs, so that they do not
+        oversubscribe the cores.
+
         Args:
             X (np.ndarray):
                 Input samples for which Shapley values are computed (shape: n_instances x n_features).
+            method (str):
+                One of "exact" (full enumeration), "kernel" (KernelSHAP),
+                "permutation" (permutation sampling) or "tree" (TreeSHAP).
+            n_samples (int):
+                Positive number of coalitions (`method="kernel"`) or permutations
+                (`method="permutation"`) sampled per instance.
+            random_state (int | None):
+                Seed for the sampling methods. Each instance gets its own stream,
+                so results do not depend on `n_jobs`.
+            n_jobs (int):
+                Number of parallel jobs (-1 uses all the processors).
 
         Returns:
             np.ndarray:
                 A 2D array of Shapley values with the same shape as `X`.
         """
-        # TODO:
-        # 1) Create an array of shape equal to `X` to hold Shapley values.
-        shapley_values = np.zeros_like(X)
-        # 2) For each instance i and each feature j:
-        #       - Compute single shapley value for feature j and instance i of X.
-        #       - Store the result in the output array at [i, j].
-        n_instances, n_features = X.shape
-        for i in range(n_instances):
-            for j in range(n_features):
-                shapley_values[i, j] = self._compute_single_shapley_value(j, X[i])
-        # 3) Return the filled Shapley array.
+        if method not in ("exact", "kernel", "permutation", "tree"):
+            raise ValueError(f"Unknown method: {method}")
+        if method == "tree" and self._tree_estimator is None:
+            raise ValueError("method='tree' requires the predict method of an XGBoost or LightGBM regressor")
+        if self.device is not None and method not in ("exact", "tree"):
+            raise ValueError(f"device is only supported by the exact method, not {method}")
+        if method in ("kernel", "permutation") and n_samples < 1:
+            raise ValueError(f"n_samples must be a positive integer, got {n_samples}")
+        if len(X) == 0:
+            return np.zeros(np.shape(X))
+        if self._linear_estimator is not None:
+            return self._linear_shap(X)
+        if method == "tree":
+            return self._tree_shap(X)
+        X = np.asarray(X, dtype=self.dtype)
+        # v(∅) depends on `model` and `background_dataset`, which may have been
+        # reassigned since the last call: evaluate it again, before dispatching
+        # the jobs so that they share it (the device path does it on the device).
+        self._v_empty = None
+        if self.device is None:
+            self._empty_value()
+        n_instances = X.shape[0]
+        seeds = np.random.SeedSequence(random_state).spawn(n_instances)
+        n_blocks = min(effective_n_jobs(n_jobs), n_instances)
+        if n_blocks <= 1:
+            return self._shapley_block(X, method, n_samples, seeds)
+        blocks = np.array_split(np.arange(n_instances), n_blocks)
+        n_threads = max(1, numba.config.NUMBA_NUM_THREADS // n_blocks) if NUMBA_AVAILABLE else None
+        rows = Parallel(n_jobs=n_jobs)(
+            delayed(self._shapley_block)(X[idx], method, n_samples, seeds[idx[0]:idx[-1] + 1], n_threads)
+            for idx in blocks
+        )
+        return np.vstack(rows)
+
+    def _shapley_block(
+        self,
+        X: np.ndarray,
+        method: str,
+        n_samples: int,
+        seeds: list[np.random.SeedSequence],
+        n_threads: int | None = None,
+    ) -> np.ndarray:
+        """Compute Shapley values for a block of instances in the current process.
+
+        The scratch buffers used to build the masked inputs are owned by the
+        block, so blocks running concurrently on threads do not share them.
+
+        Args:
+            X (np.ndarray):
+                Input samples (shape: n_instances x n_features).
+            method (str):
+                One of "exact", "kernel" or "permutation" (see `shapley_values`).
+            n_samples (int):
+                Number of coalitions or permutations sampled per instance.
+            seeds (list[np.random.SeedSequence]):
+                One seed per instance for the sampling methods.
+            n_threads (int | None):
+                Number of numba threads used by this block (None to leave the
+                current setting), to share the cores between joblib workers.
+
+        Returns:
+            np.ndarray:
+                A 2D array of Shapley values with the same shape as `X`.
+        """
+        if n_threads is not None:
+            numba.set_num_threads(n_threads)
+        # 1) Create an array of shape equal to `X` to hold Shapley values, and the
+        #    scratch buffers of this block (allocated lazily).
+        shapley_values = np.zeros(X.shape, dtype=float)
+        buffers: dict[str, np.ndarray] = {}
+        n_instances = X.shape[0]
+        if method in ("kernel", "permutation"):
+            estimator = self._kernel_shap if method == "kernel" else self._permutation_shap
+            for i in range(n_instances):
+                rng = np.random.default_rng(seeds[i])
+                shapley_values[i] = estimator(X[i], n_samples, rng, buffers)
+            return shapley_values
+        # 2) The exact method stacks one masked copy of the background per instance
+        #    and coalition: explain the instances in chunks small enough for a
+        #    single coalition of the whole chunk to fit in the memory budget.
+        chunk_size = max(1, self.max_memory_bytes // self.background_dataset.nbytes)
+        for start in range(0, n_instances, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            if self.device is not None:
+                shapley_values[chunk] = self._device_shapley_values(X[chunk])
+            else:
+                shapley_values[chunk] = self._exact_shapley_values(X[chunk], buffers)
+        return shapley_values
+
+    def _exact_shapley_values(self, X: np.ndarray, buffers: dict[str, np.ndarray]) -> np.ndarray:
+        """Compute exact Shapley values by enumerating every coalition.
+
+        Args:
+            X (np.ndarray):
+                Input samples (shape: n_instances x n_features).
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
+
+        Returns:
+            np.ndarray:
+                A 2D array of Shapley values with the same shape as `X`.
+        """
+        shapley_values = np.zeros(X.shape, dtype=float)
+        n_features = X.shape[1]
+        # 1) v(∅) and v(all features) need no masking, and enter every phi_j with
+        #    weights -w[0] and w[n_features - 1], both equal to 1 / n_features.
+        total = self._full_values(X) - self._empty_value()
+        shapley_values[:, :-1] = (total / n_features)[:, None]
+        # 2) The other coalitions are the same for every instance: evaluate them for
+        #    all the instances jointly, one batch at a time (coalition k is the bitmask k).
+        for coalitions, values in self._iter_coalition_values(X, buffers):
+            # 3) Flush the batch: v(S) enters phi_j with weight w[|S| - 1] if j is in S
+            #    and -w[|S|] otherwise, so no table of all v(S) is kept.
+            coefficients = self._contribution_coefficients(coalitions, n_features)
+            shapley_values[:, :-1] += values @ coefficients[:, :-1]
+        # 4) The efficiency property gives the last feature: sum_j phi_j = v(all) - v(∅).
+        shapley_values[:, -1] = total - shapley_values[:, :-1].sum(axis=1)
         return shapley_values
 
-    def _compute_single_shapley_value(self, feature: int, instance: np.ndarray) -> float:
-        """Compute the Shapley value for a single feature in one instance.
+    def _linear_shap(self, X: np.ndarray) -> np.ndarray:
+        """Compute exact Shapley values for a linear model in closed form.
 
-        Implements the Shapley formula (weighted average of marginal contributions)
-        across all subsets that do not include the current feature.
+        For f(x) = x @ coef + intercept, v(S) is linear in the conditioned
+        features, so phi_j = coef_j * (x_j - E[X_j]) with the expectation taken
+        over the background dataset.
+
+        Args:
+            X (np.ndarray):
+                Input samples (shape: n_instances x n_features).
+
+        Returns:
+            np.ndarray:
+                A 2D array of Shapley values with the same shape as `X`.
+        """
+        coef = np.asarray(self._linear_estimator.coef_, dtype=float)
+        background_mean = self.background_dataset.mean(axis=0, dtype=float)
+        return coef * (np.asarray(X, dtype=float) - background_mean)
+
+    def _tree_shap(self, X: np.ndarray) -> np.ndarray:
+        """Compute Shapley values with the TreeSHAP implementation of the model's library.
+
+        TreeSHAP runs in polynomial time in the tree depth instead of
+        enumerating coalitions. The expectations are taken over the training
+        samples that reached each node, so the values sum to f(x) minus the
+        model's expected value on the training data rather than on the
+        background dataset.
+
+        Args:
+            X (np.ndarray):
+                Input samples (shape: n_instances x n_features).
+
+        Returns:
+            np.ndarray:
+                A 2D array of Shapley values with the same shape as `X`.
+        """
+        estimator = self._tree_estimator
+        if hasattr(estimator, "get_booster"):
+            import xgboost
+
+            contributions = estimator.get_booster().predict(xgboost.DMatrix(X), pred_contribs=True)
+        else:
+            contributions = estimator.booster_.predict(X, pred_contrib=True)
+        # The last column is the bias term (the expected value).
+        return np.asarray(contributions, dtype=float)[:, :-1]
+
+    def _kernel_shap(
+        self,
+        instance: np.ndarray,
+        n_samples: int,
+        rng: np.random.Generator,
+        buffers: dict[str, np.ndarray],
+    ) -> np.ndarray:
+        """Estimate the Shapley values of one instance with KernelSHAP.
+
+        Fits the linear model v(S) ≈ v(∅) + sum_{j in S} phi_j by weighted least
+        squares under the efficiency constraint sum_j phi_j = v(all) - v(∅).
+        If `n_samples` covers every non-trivial coalition they are all used with
+        their SHAP kernel weights, which recovers the exact Shapley values.
+        Otherwise coalition sizes are sampled proportionally to the total kernel
+        weight of each size, and the subsets uniformly within a size, so every
+        sampled row gets the same weight.
 
         Args:
-            feature (int):
-                Index of the feature for which the Shapley value is computed.
             instance (np.ndarray):
                 The input instance (1D, length = n_features).
+            n_samples (int):
+                Number of coalitions to sample.
+            rng (np.random.Generator):
+                Random generator used for the sampling.
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
 
         Returns:
-            float:
-                The Shapley value for the given feature.
+            np.ndarray:
+                Array of length n_features with the estimated Shapley values.
+        """
+        n_features = len(instance)
+        empty, full = 0, (1 << n_features) - 1
+        # 1) Choose the coalitions: all of them if affordable, otherwise a sample.
+        if 2**n_features - 2 <= n_samples:
+            subsets = list(range(1, full))
+            sizes = np.array([S.bit_count() for S in subsets])
+            sample_weights = (n_features - 1) / (
+                np.array([comb(n_features, k) for k in sizes]) * sizes * (n_features - sizes)
+            )
+        else:
+            k = np.arange(1, n_features)
+            size_probs = (n_features - 1) / (k * (n_features - k))
+            sizes = rng.choice(k, size=n_samples, p=size_probs / size_probs.sum())
+            subsets = [
+                int(np.sum(1 << rng.choice(n_features, size, replace=False))) for size in sizes
+            ]
+            sample_weights = np.ones(len(subsets))
+        Z = self._coalition_masks(subsets, n_features).astype(float)
+        # 2) Evaluate v(S) for the chosen coalitions. v(∅) and v(all features)
+        #    are known without masking the background.
+        v_empty = self._empty_value()
+        v_full = float(self._full_values(instance[None, :])[0])
+        coalition_values = self._coalition_values(subsets, instance, buffers, {empty: v_empty, full: v_full})
+        y = np.array([coalition_values[S] for S in subsets]) - v_empty
+        # 3) Enforce the efficiency constraint by eliminating the last feature:
+        #    phi_last = (v_full - v_empty) - sum of the other phis.
+        total = v_full - v_empty
+        y = y - Z[:, -1] * total
+        Z = Z[:, :-1] - Z[:, -1:]
+        # 4) Solve the weighted least-squares problem for the remaining features.
+        sqrt_w = np.sqrt(sample_weights)
+        phi = np.linalg.lstsq(Z * sqrt_w[:, None], y * sqrt_w, rcond=None)[0]
+        return np.append(phi, total - phi.sum())
+
+    def _permutation_shap(
+        self,
+        instance: np.ndarray,
+        n_permutations: int,
+        rng: np.random.Generator,
+        buffers: dict[str, np.ndarray],
+    ) -> np.ndarray:
+        """Estimate the Shapley values of one instance by permutation sampling.
+
+        For a random ordering of the features, adding them one at a time gives
+        one marginal contribution v(prefix + j) - v(prefix) for every feature
+        j, using only n_features + 1 coalitions. Averaging over orderings is an
+        unbiased estimate of the Shapley values. Orderings are drawn in
+        antithetic pairs (a permutation and its reverse) to reduce the variance.
+
+        Args:
+            instance (np.ndarray):
+                The input instance (1D, length = n_features).
+            n_permutations (int):
+                Number of orderings to evaluate (rounded up to an even number).
+            rng (np.random.Generator):
+                Random generator used for the sampling.
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
+
+        Returns:
+            np.ndarray:
+                Array of length n_features with the estimated Shapley values.
         """
-        # TODO:
-        # 1) Determine the total number of features from `instance`.
         n_features = len(instance)
-        # 2) Initialize an accumulator for the Shapley value.
-        accumulator = 0.0
-        # 3) Iterate over all subsets of "other" features (i.e., excluding `feature`):
-        #       - Let S be such a subset (a tuple of indices).
-        #       - Compute model expectation with S only: E[f(X) | X_S = instance_S]
-        #         (use `_subset_model_approximation(S, instance)`).
-        #       - Compute model expectation with S ∪ {feature}:
-        #         `_subset_model_approximation(S_plus_feature, instance)`.
-        #       - Compute the permutation weight using `_permutation_factor(n_features, len(S))`.
-        #       - Add weight * (with_feature - without_feature) to the accumulator.
-    
-        for S in self._get_all_other_feature_subsets(n_features, feature):
-            S_plus_feature = S + (feature, )
-            without_feature = self._subset_model_approximation(S, instance)
-            with_feature = self._subset_model_approximation(S_plus_feature, instance)
-            weight = self._permutation_factor(n_features, len(S))
-            accumulator += weight*(with_feature-without_feature)
-            
-        # 4) Return the accumulated value.
-        # Hints:
-        # - To form S ∪ {feature}, concatenate the tuple with `(feature,)`.
-        # - Keep computations in float to avoid integer division issues.
-        return float(accumulator)
-
-    def _get_all_subsets(self, items: list[int]) -> Iterable[tuple[int, ...]]:
-        """Generate all subsets of a list.
-
-        Args:
-            items (list[int]):
-                List of feature indices.
-
-        Returns:
-            Iterable[tuple[int, ...]]:
-                Iterator over all possible subsets (including empty and full).
-        """
-        # TODO:
-        # 1) Return an iterator over all k-combinations for k = 0..len(items).
-        # Hints:
-        # - Use `itertools.combinations(items, r)` inside a generator expression.
-        # - You can flatten with `itertools.chain.from_iterable(...)`.
-        return chain.from_iterable(combinations(items, r) for r in range((len(items)+1)))
-
-    def _get_all_other_feature_subsets(self, n_features: int, feature_of_interest: int) -> Iterable[tuple[int, ...]]:
-        """Generate all subsets of features excluding the feature of interest.
+        n_pairs = max(1, (n_permutations + 1) // 2)
+        phi = np.zeros(n_features)
+        # 1) v(all features) is the same for every ordering: evaluate it once.
+        v_full = float(self._full_values(instance[None, :])[0])
+        for _ in range(n_pairs):
+            # 2) Draw an ordering and its reverse.
+            perm = rng.permutation(n_features)
+            orders = np.stack((perm, perm[::-1]))
+            # 3) Evaluate the prefixes of both orderings with a single model call.
+            path_values = self._path_values(orders, instance, v_full, buffers)
+            # 4) Each step along an ordering is the marginal contribution of the added feature.
+            for order, values in zip(orders, path_values):
+                phi[order] += np.diff(values)
+        return phi / (2 * n_pairs)
+
+    def _coalition_masks(self, coalitions: list[int] | np.ndarray, n_features: int) -> np.ndarray:
+        """Convert coalition bitmasks into a boolean membership matrix.
 
         Args:
+            coalitions (list[int] | np.ndarray):
+                Coalition bitmasks.
             n_features (int):
                 Total number of features.
-            feature_of_interest (int):
-                Index of the feature to exclude.
 
         Returns:
-            Iterable[tuple[int, ...]]:
-                Iterator of feature index subsets not containing the feature of interest.
+            np.ndarray:
+                Boolean array of shape (n_coalitions, n_features) whose entry
+                [k, j] tells whether feature j belongs to coalition k.
         """
-        # TODO:
-        # 1) Build a list of all feature indices except `feature_of_interest`.
-        other_features = [i for i in range(n_features) if i!=feature_of_interest]
-        # 2) Return all subsets of that list by calling `_get_all_subsets(...)`.
-        # Hints:
-        # - A list comprehension over range(n_features) works well for step (1).
-        return self._get_all_subsets(other_features)
+        coalitions = np.asarray(coalitions, dtype=np.int64)
+        return ((coalitions[:, None] >> np.arange(n_features)) & 1).astype(bool)
 
     def _permutation_factor(self, n_features: int, n_subset: int) -> float:
         """Compute the permutation weighting factor for a subset.
@@ -158,47 +528,364 @@ class ShapleyExplainer:
                 Permutation weight for the subset:
                 |S|! * (M - |S| - 1)! / M!  where M = n_features.
         """
-        # TODO:
-        # 1) Translate the formula into code using factorials.
-        weight = factorial(n_subset)*factorial(n_features - n_subset -1)/factorial(n_features)
-        # 2) Return the resulting float.
-        # Hints:
-        # - Use `math.factorial` imported above.
-        return weight
+        return factorial(n_subset) * factorial(n_features - n_subset - 1) / factorial(n_features)
+
+    def _weights(self, n_features: int) -> np.ndarray:
+        """Return the permutation weights for every subset size.
+
+        Evaluated once per number of features (see `_enum`), so the factorials
+        are not re-evaluated for every subset.
+
+        Args:
+            n_features (int):
+                Total number of features.
+
+        Returns:
+            np.ndarray:
+                Array `w` of length `n_features` with `w[k] = _permutation_factor(n_features, k)`.
+        """
+        return np.array([self._permutation_factor(n_features, k) for k in range(n_features)])
 
-    def _subset_model_approximation(self, feature_subset: tuple[int, ...], instance: np.ndarray) -> float:
-        """Approximate the model output conditioned on a subset of features.
+    def _enum(self, n_features: int) -> dict[str, np.ndarray]:
+        """Return the enumeration of all coalitions used by the exact method.
 
-        This simulates E[f(X) | X_S = instance_S] by:
-        - Copying the background dataset.
-        - Overwriting the columns in S with the corresponding values from `instance`.
-        - Predicting on the modified background.
-        - Returning the mean prediction as the conditional expectation.
+        The tables only depend on the number of features, so they are built
+        once and cached on the explainer instead of being regenerated for
+        every call, instance or feature.
 
         Args:
-            feature_subset (tuple[int, ...]):
-                Indices of the features to condition on.
+            n_features (int):
+                Total number of features.
+
+        Returns:
+            dict[str, np.ndarray]:
+                - "masks": (2^n_features, n_features) boolean membership matrix,
+                  row S being the coalition with bitmask S.
+                - "sizes": (2^n_features,) number of features of each coalition.
+                - "padded_weights": (n_features + 2,) permutation weights indexed
+                  by size + 1, with zeros at both ends.
+        """
+        if n_features not in self._enum_cache:
+            masks = self._coalition_masks(np.arange(1 << n_features), n_features)
+            self._enum_cache[n_features] = {
+                "masks": masks,
+                "sizes": masks.sum(axis=1),
+                "padded_weights": np.concatenate(([0.0], self._weights(n_features), [0.0])),
+            }
+        return self._enum_cache[n_features]
+
+    def _contribution_coefficients(self, coalitions: np.ndarray, n_features: int) -> np.ndarray:
+        """Return the coefficient of each coalition value in each Shapley value.
+
+        The Shapley formula is linear in the coalition values:
+        phi_j = sum_S c[S, j] * v(S), with c[S, j] = w[|S| - 1] if j is in S and
+        c[S, j] = -w[|S|] otherwise. This lets batches of v(S) be reduced as
+        soon as they are computed.
+
+        Args:
+            coalitions (np.ndarray):
+                Coalition bitmasks.
+            n_features (int):
+                Total number of features.
+
+        Returns:
+            np.ndarray:
+                Array of shape (n_coalitions, n_features) with the coefficients.
+        """
+        enum = self._enum(n_features)
+        padded_weights = enum["padded_weights"]
+        sizes = enum["sizes"][coalitions]
+        return np.where(
+            enum["masks"][coalitions],
+            padded_weights[sizes][:, None],
+            -padded_weights[sizes + 1][:, None],
+        )
+
+    def _empty_value(self) -> float:
+        """Return v(∅), the mean model output over the background dataset.
+
+        It does not depend on the instance, so it is computed once per
+        `shapley_values` call and cached until the next one.
+
+        Returns:
+            float:
+                E[f(X)] over the background dataset.
+        """
+        if self._v_empty is None:
+            self._v_empty = float(np.mean(self.model(self.background_dataset)))
+        return self._v_empty
+
+    def _full_values(self, X: np.ndarray) -> np.ndarray:
+        """Return v(all features) for each instance.
+
+        Conditioning on every feature replaces every background row by the
+        instance, so the expectation is just the model output on the instance.
+
+        Args:
+            X (np.ndarray):
+                Instances (shape: n_instances x n_features).
+
+        Returns:
+            np.ndarray:
+                Array of length n_instances with f(x) for each instance.
+        """
+        return np.asarray(self.model(X), dtype=float).reshape(X.shape[0])
+
+    def _coalition_batch_size(self, n_copies: int) -> int:
+        """Return the number of coalitions to evaluate per model call.
+
+        Args:
+            n_copies (int):
+                Number of masked copies of the background built per coalition
+                (one per instance evaluated jointly).
+
+        Returns:
+            int:
+                `batch_size` if set, otherwise the largest batch whose masked
+                input fits in `max_memory_bytes` (at least 1).
+        """
+        if self.batch_size is not None:
+            return self.batch_size
+        return max(1, self.max_memory_bytes // (n_copies * self.background_dataset.nbytes))
+
+    def _coalition_values(
+        self,
+        coalitions: list[int],
+        instance: np.ndarray,
+        buffers: dict[str, np.ndarray],
+        cache: dict[int, float] | None = None,
+    ) -> dict[int, float]:
+        """Approximate the model output for many coalitions with batched model calls.
+
+        Builds one masked copy of the background dataset per coalition, stacked
+        into an array of shape (n_coalitions * n_background, n_features), predicts on it
+        and averages the predictions of each block. Coalitions are processed in
+        batches of `_coalition_batch_size` to bound memory. Coalitions that are
+        repeated or already present in `cache` are not evaluated again.
+
+        Args:
+            coalitions (list[int]):
+                Bitmasks of the feature subsets to condition on (duplicates allowed).
             instance (np.ndarray):
                 Instance whose feature values are used to overwrite the background.
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
+            cache (dict[int, float] | None):
+                Optional per-instance table of already computed values. It is
+                updated in place and must only be shared between calls with
+                the same `instance`.
 
         Returns:
-            float:
-                The mean model output given the subset of features.
-        """
-        # TODO:
-        # 1) Make a copy of the background dataset (avoid mutating the original).
-        dataset = deepcopy(self.background_dataset)
-        n_features = len(dataset)
-        # 2) For each feature index j in 0..(n_features-1):
-        #       - If j is in `feature_subset`, replace the j-th column of the copy
-        #         with the scalar value `instance[j]` (broadcast to all rows).
-        for j in range(0, n_features-1):
-            if j in feature_subset:
-                dataset[:, j] = instance[j]
-        # 3) Call the model on the modified background to get predictions.
-        predictions = self.model(dataset)
-        # 4) Return the mean of those predictions as a scalar float.
-        # Hints:
-        # - Column assignment can broadcast a scalar to all rows in NumPy.
-        # - Some models return shape (n,) and others (n, 1); take the mean robustly.
-        return float(np.mean(predictions))
\ No newline at end of file
+            dict[int, float]:
+                The mean model output for each coalition (the updated `cache`).
+        """
+        if cache is None:
+            cache = {}
+        missing = [S for S in dict.fromkeys(coalitions) if S not in cache]
+        if not missing:
+            return cache
+        n_background, n_features = self.background_dataset.shape
+        n_coalitions = len(missing)
+        batch_size = self._coalition_batch_size(1)
+        # 1) Coalition-membership matrix of shape (n_coalitions, n_features).
+        masks = self._coalition_masks(missing, n_features)
+        values = np.empty(n_coalitions)
+        for start in range(0, n_coalitions, batch_size):
+            stop = min(start + batch_size, n_coalitions)
+            # 2) Select each column of each block from the instance or from the background.
+            stacked = self._masked_batch(instance[None, :], masks[start:stop], buffers)
+            # 3) Predict on the batch and average over the background rows of each block.
+            predictions = np.asarray(self.model(stacked.reshape(-1, n_features)))
+            values[start:stop] = predictions.reshape(stop - start, n_background).mean(axis=1)
+        cache.update(zip(missing, values.tolist()))
+        return cache
+
+    def _masked_batch(self, X: np.ndarray, masks: np.ndarray, buffers: dict[str, np.ndarray]) -> np.ndarray:
+        """Build the masked copies of the background for a batch of coalitions.
+
+        With numba, the blocks are written by the compiled `_fill_masked`
+        kernel into `buffers["batch"]`, reused across batches; otherwise they
+        are built with `np.where`. The returned array is only valid until the
+        next call with the same buffers.
+
+        Args:
+            X (np.ndarray):
+                Instances whose feature values are used to overwrite the background
+                (shape: n_instances x n_features).
+            masks (np.ndarray):
+                Boolean coalition-membership matrix, shape (n_coalitions, n_features).
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
+
+        Returns:
+            np.ndarray:
+                Array of shape (n_instances, n_coalitions, n_background, n_features)
+                whose block [i, k] is the background with the columns of
+                coalition k taken from `X[i]`.
+        """
+        n_background, n_features = self.background_dataset.shape
+        shape = (X.shape[0], masks.shape[0], n_background, n_features)
+        if not NUMBA_AVAILABLE:
+            return np.where(
+                masks[None, :, None, :], X[:, None, None, :], self.background_dataset[None, None, :, :]
+            )
+        size = int(np.prod(shape))
+        if "batch" not in buffers or buffers["batch"].size < size:
+            buffers["batch"] = np.empty(size, dtype=self.dtype)
+        out = buffers["batch"][:size].reshape(shape)
+        _fill_masked(self.background_dataset, np.ascontiguousarray(X, dtype=self.dtype), masks, out)
+        return out
+
+    def _iter_coalition_values(
+        self, X: np.ndarray, buffers: dict[str, np.ndarray]
+    ) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """Approximate the model output for every coalition and instance, batch by batch.
+
+        For each batch of coalitions, builds the tensor of shape
+        (n_instances, batch_size, n_background, n_features) whose block [i, k]
+        is the background with the columns of coalition k taken from `X[i]`,
+        predicts on it flattened and averages over the background rows. Batches
+        are yielded as soon as they are evaluated, so neither the masked tensor
+        nor the table of all v(S) is ever built in full. The empty and full
+        coalitions are skipped: v(∅) is the mean prediction on the background
+        and v(all features) is f(x).
+
+        Args:
+            X (np.ndarray):
+                Instances whose feature values are used to overwrite the background.
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
+
+        Yields:
+            tuple[np.ndarray, np.ndarray]:
+                The bitmasks of the coalitions in the batch, and an array of shape
+                (n_instances, n_coalitions_in_batch) with the mean model output of
+                every instance for each of them.
+        """
+        n_instances, n_features = X.shape
+        n_background = self.background_dataset.shape[0]
+        n_coalitions = 1 << n_features
+        batch_size = self._coalition_batch_size(n_instances)
+        # 1) Cached coalition-membership matrix of shape (n_coalitions, n_features).
+        masks = self._enum(n_features)["masks"]
+        for start in range(1, n_coalitions - 1, batch_size):
+            stop = min(start + batch_size, n_coalitions - 1)
+            # 2) Select each column from the instance or from the background.
+            masked = self._masked_batch(X, masks[start:stop], buffers)
+            # 3) Predict on the batch and average over the background rows of each block.
+            predictions = np.asarray(self.model(masked.reshape(-1, n_features)))
+            values = predictions.reshape(n_instances, stop - start, n_background).mean(axis=2)
+            yield np.arange(start, stop), values
+
+    def _device_shapley_values(self, X: np.ndarray) -> np.ndarray:
+        """Compute exact Shapley values on the PyTorch device `self.device`.
+
+        Same computation as `_exact_shapley_values`, but the
+        background and the instances are moved to the device once, the
+        coalition masks and the masked batches are synthesized there with
+        `torch.where`, the model is called on device tensors and the batches
+        are reduced on the device. Only the final Shapley values are copied
+        back to the host.
+
+        Args:
+            X (np.ndarray):
+                Input samples (shape: n_instances x n_features).
+
+        Returns:
+            np.ndarray:
+                A 2D array of Shapley values with the same shape as `X`.
+        """
+        import torch
+
+        n_instances, n_features = X.shape
+        n_background = self.background_dataset.shape[0]
+        n_coalitions = 1 << n_features
+        batch_size = self._coalition_batch_size(n_instances)
+        # 1) Move the inputs and the permutation weights to the device once.
+        background = torch.as_tensor(self.background_dataset, device=self.device)
+        instances = torch.as_tensor(X, device=self.device)
+        padded_weights = torch.as_tensor(self._enum(n_features)["padded_weights"], device=self.device)
+        coalitions = torch.arange(n_coalitions, device=self.device)
+        bits = torch.arange(n_features, device=self.device)
+        with torch.no_grad():
+            # 2) v(∅) and v(all features) need no masking (weights -1/n and 1/n in every phi_j).
+            v_empty = torch.as_tensor(self.model(background), device=self.device).double().mean()
+            v_full = torch.as_tensor(self.model(instances), device=self.device).double().reshape(n_instances)
+            total = v_full - v_empty
+            phi = (total / n_features)[:, None].repeat(1, n_features - 1)
+            for start in range(1, n_coalitions - 1, batch_size):
+                stop = min(start + batch_size, n_coalitions - 1)
+                # 3) Build the coalition masks and the masked batch on the device.
+                masks = ((coalitions[start:stop, None] >> bits) & 1).bool()
+                masked = torch.where(
+                    masks[None, :, None, :],
+                    instances[:, None, None, :],
+                    background[None, None, :, :],
+                )
+                # 4) Predict on the batch, average over the background rows of each
+                #    block and flush it with the coefficients of `_contribution_coefficients`.
+                predictions = torch.as_tensor(self.model(masked.reshape(-1, n_features)), device=self.device)
+                values = predictions.reshape(n_instances, stop - start, n_background).double().mean(dim=2)
+                sizes = masks.sum(dim=1)
+                coefficients = torch.where(
+                    masks[:, :-1], padded_weights[sizes][:, None], -padded_weights[sizes + 1][:, None]
+                )
+                phi += values @ coefficients
+            # 5) The efficiency property gives the last feature.
+            phi = torch.cat((phi, (total - phi.sum(dim=1))[:, None]), dim=1)
+        # 6) Copy the Shapley values back to the host once.
+        return phi.cpu().numpy()
+
+    def _path_values(
+        self, orders: np.ndarray, instance: np.ndarray, v_full: float, buffers: dict[str, np.ndarray]
+    ) -> np.ndarray:
+        """Approximate the model output along feature orderings with a single model call.
+
+        For each ordering, the coalitions are its prefixes: block k conditions on
+        the first k features of the ordering. Consecutive prefixes differ by one
+        feature, so each block is copied from the previous one and only the
+        added column is overwritten, instead of re-masking every column of the
+        background. The blocks live in `buffers["path"]`, reused across calls.
+        The empty and full prefixes are the same for every ordering and are not
+        masked.
+
+        Args:
+            orders (np.ndarray):
+                Feature orderings, shape (n_orders, n_features).
+            instance (np.ndarray):
+                Instance whose feature values are used to overwrite the background.
+            v_full (float):
+                Model output on `instance`, i.e. v(all features).
+            buffers (dict[str, np.ndarray]):
+                Scratch buffers of the calling `_shapley_block`, reused across calls.
+
+        Returns:
+            np.ndarray:
+                Array of shape (n_orders, n_features + 1) whose entry [r, k] is the
+                mean model output conditioned on the first k features of ordering r.
+        """
+        n_orders, n_features = orders.shape
+        n_background = self.background_dataset.shape[0]
+        values = np.empty((n_orders, n_features + 1))
+        # 1) The endpoints of every ordering are v(∅) and v(all features).
+        values[:, 0] = self._empty_value()
+        values[:, -1] = v_full
+        n_steps = n_features - 1
+        if n_steps == 0:
+            return values
+        # 2) Reuse the path buffer for the intermediate prefixes when the shapes match.
+        shape = (n_orders, n_steps, n_background, n_features)
+        if "path" not in buffers or buffers["path"].shape != shape:
+            buffers["path"] = np.empty(shape, dtype=self.background_dataset.dtype)
+        path = buffers["path"]
+        # 3) Start every ordering from the background and add one column per step.
+        for r, order in enumerate(orders):
+            previous = self.background_dataset
+            for k, j in enumerate(order[:-1]):
+                path[r, k] = previous
+                path[r, k, :, j] = instance[j]
+                previous = path[r, k]
+        # 4) Predict once and average over the background rows of each block.
+        predictions = np.asarray(self.model(path.reshape(-1, n_features)))
+        values[:, 1:-1] = predictions.reshape(n_orders, n_steps, n_background).mean(axis=2)
+        return values
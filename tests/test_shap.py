@@ -147,4 +147,222 @@ def test_additivity_property(models, background_and_instances, model_key):
     assert np.allclose(lhs, rhs, rtol=1e-5, atol=1e-4), (
         f"Additivity failed for {model_key}. "
         f"Max abs diff: {np.max(np.abs(lhs - rhs)):.6f}"
-    )
\ No newline at end of file
+    )
+
+
+@pytest.mark.parametrize("model_key", ["linear", "random_forest", "gradient_boosting"])
+def test_kernel_method_matches_exact(models, background_and_instances, model_key):
+    """KernelSHAP over every coalition recovers the exact Shapley values."""
+    model = models[model_key]
+    X_background, X_instances = background_and_instances
+    n_features = X_instances.shape[1]
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    exact_vals = explainer.shapley_values(X_instances)
+    kernel_vals = explainer.shapley_values(X_instances, method="kernel", n_samples=2 ** n_features)
+
+    assert np.allclose(kernel_vals, exact_vals, rtol=1e-5, atol=1e-4), (
+        f"Kernel method disagrees with exact enumeration for {model_key}. "
+        f"Max abs diff: {np.max(np.abs(kernel_vals - exact_vals)):.6f}"
+    )
+
+
+@pytest.mark.parametrize("model_key", ["random_forest", "gradient_boosting"])
+def test_sampled_kernel_method_approximates_exact(models, background_and_instances, model_key):
+    """KernelSHAP from a sample of the coalitions stays close to the exact Shapley values."""
+    model = models[model_key]
+    X_background, X_instances = background_and_instances
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    exact_vals = explainer.shapley_values(X_instances)
+    # 512 samples is below the 2^10 - 2 non-trivial coalitions, so they are sampled.
+    kernel_vals = explainer.shapley_values(X_instances, method="kernel", n_samples=512, random_state=0)
+
+    rel_err = np.linalg.norm(kernel_vals - exact_vals) / np.linalg.norm(exact_vals)
+    assert rel_err < 0.15, (
+        f"Sampled kernel method is far from exact enumeration for {model_key}. "
+        f"Relative error: {rel_err:.4f}"
+    )
+
+
+@pytest.mark.parametrize("method", ["exact", "kernel"])
+def test_parallel_matches_sequential(models, background_and_instances, method):
+    """Splitting the instances across jobs does not change the Shapley values."""
+    model = models["gradient_boosting"]
+    X_background, X_instances = background_and_instances
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    sequential = explainer.shapley_values(X_instances, method=method, n_samples=256, random_state=0)
+    parallel = explainer.shapley_values(X_instances, method=method, n_samples=256, random_state=0, n_jobs=2)
+
+    assert np.allclose(parallel, sequential)
+
+
+@pytest.mark.parametrize("model_key", ["linear", "random_forest", "gradient_boosting"])
+def test_permutation_method_additivity(models, background_and_instances, model_key):
+    """Every sampled ordering telescopes to f(x) - E[f(X_background)]."""
+    model = models[model_key]
+    X_background, X_instances = background_and_instances
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    perm_vals = explainer.shapley_values(X_instances, method="permutation", n_samples=64, random_state=0)
+    f_bg = np.mean(model.predict(X_background))
+    lhs = perm_vals.sum(axis=1)
+    rhs = model.predict(X_instances) - f_bg
+
+    assert np.allclose(lhs, rhs, rtol=1e-5, atol=1e-4), (
+        f"Additivity failed for permutation sampling with {model_key}. "
+        f"Max abs diff: {np.max(np.abs(lhs - rhs)):.6f}"
+    )
+
+
+@pytest.mark.parametrize("model_key", ["random_forest", "gradient_boosting"])
+def test_permutation_method_approximates_exact(models, background_and_instances, model_key):
+    """Permutation sampling assigns the contributions to the right features."""
+    model = models[model_key]
+    X_background, X_instances = background_and_instances
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    exact_vals = explainer.shapley_values(X_instances)
+    perm_vals = explainer.shapley_values(X_instances, method="permutation", n_samples=64, random_state=0)
+
+    rel_err = np.linalg.norm(perm_vals - exact_vals) / np.linalg.norm(exact_vals)
+    assert rel_err < 0.1, (
+        f"Permutation method is far from exact enumeration for {model_key}. "
+        f"Relative error: {rel_err:.4f}"
+    )
+
+
+@pytest.mark.parametrize("method", ["exact", "kernel"])
+def test_batched_evaluation_matches_single_call(models, background_and_instances, method):
+    """Streaming coalitions in small batches does not change the Shapley values."""
+    model = models["random_forest"]
+    X_background, X_instances = background_and_instances
+
+    single_call = ShapleyExplainer(model.predict, X_background)
+    batched = ShapleyExplainer(model.predict, X_background, batch_size=7)
+
+    expected = single_call.shapley_values(X_instances, method=method, n_samples=256, random_state=0)
+    actual = batched.shapley_values(X_instances, method=method, n_samples=256, random_state=0)
+
+    assert np.allclose(actual, expected)
+
+
+def test_linear_closed_form_matches_enumeration(models, background_and_instances):
+    """The closed form used for linear models agrees with full enumeration."""
+    model = models["linear"]
+    X_background, X_instances = background_and_instances
+
+    closed_form = ShapleyExplainer(model.predict, X_background)
+    # A wrapped predict is not recognised as a linear model, so it is enumerated.
+    enumerated = ShapleyExplainer(lambda X: model.predict(X), X_background)
+
+    assert np.allclose(
+        closed_form.shapley_values(X_instances),
+        enumerated.shapley_values(X_instances),
+        rtol=1e-5,
+        atol=1e-3,
+    )
+
+
+def test_tree_method_additivity(data, background_and_instances):
+    """TreeSHAP values sum to f(x) minus a constant expected value."""
+    xgboost = pytest.importorskip("xgboost")
+    X_train, _, y_train, _ = data
+    X_background, X_instances = background_and_instances
+    model = xgboost.XGBRegressor(n_estimators=50, max_depth=3, random_state=42).fit(X_train, y_train)
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    phi = explainer.shapley_values(X_instances, method="tree")
+
+    assert phi.shape == X_instances.shape
+    assert np.ptp(model.predict(X_instances) - phi.sum(axis=1)) < 1e-3
+
+
+@pytest.mark.parametrize("method", ["exact", "kernel", "permutation"])
+def test_empty_input_returns_empty_array(models, background_and_instances, method):
+    """Explaining zero instances returns an empty array instead of failing."""
+    model = models["random_forest"]
+    X_background, X_instances = background_and_instances
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    values = explainer.shapley_values(X_instances[:0], method=method)
+
+    assert values.shape == (0, X_instances.shape[1])
+
+
+def test_reassigned_background_is_used(models, background_and_instances):
+    """Replacing the background between calls gives the same values as a fresh explainer."""
+    model = models["random_forest"]
+    X_background, X_instances = background_and_instances
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    explainer.shapley_values(X_instances)
+    explainer.background_dataset = X_background[:5]
+    fresh = ShapleyExplainer(model.predict, X_background[:5])
+
+    assert np.allclose(explainer.shapley_values(X_instances), fresh.shapley_values(X_instances))
+
+
+@pytest.mark.parametrize("method", ["exact", "kernel", "permutation"])
+def test_threading_backend_matches_sequential(models, data, background_and_instances, method):
+    """Jobs running on threads do not share scratch buffers."""
+    model = models["gradient_boosting"]
+    _, X_test, _, _ = data
+    X_background, _ = background_and_instances
+    X_instances = X_test[:16]
+
+    explainer = ShapleyExplainer(model.predict, X_background)
+    sequential = explainer.shapley_values(X_instances, method=method, n_samples=64, random_state=0)
+    with joblib.parallel_config(backend="threading"):
+        threaded = explainer.shapley_values(X_instances, method=method, n_samples=64, random_state=0, n_jobs=4)
+
+    assert np.allclose(threaded, sequential)
+
+
+
+def test_exact_model_inputs_stay_within_memory_budget(data, background_and_instances):
+    """Each model call of the exact method receives at most `max_memory_bytes`."""
+    _, X_test, _, _ = data
+    X_background, _ = background_and_instances
+    X_instances = X_test[:40]
+    input_sizes = []
+
+    def model(X):
+        input_sizes.append(X.nbytes)
+        return X.sum(axis=1)
+
+    budget = 8 * ShapleyExplainer(model, X_background).background_dataset.nbytes
+    bounded = ShapleyExplainer(model, X_background, max_memory_bytes=budget)
+    values = bounded.shapley_values(X_instances)
+
+    assert max(input_sizes) <= budget
+    assert np.allclose(values, ShapleyExplainer(model, X_background).shapley_values(X_instances))
+
+
+
+@pytest.mark.parametrize("batch_size", [None, 3])
+def test_device_path_matches_numpy(models, background_and_instances, batch_size):
+    """Building and reducing the batches on a PyTorch device gives the NumPy exact values."""
+    torch = pytest.importorskip("torch")
+    model = models["gradient_boosting"]
+    X_background, X_instances = background_and_instances
+
+    def torch_model(X):
+        return torch.as_tensor(model.predict(X.cpu().numpy()))
+
+    on_host = ShapleyExplainer(model.predict, X_background, batch_size=batch_size)
+    on_device = ShapleyExplainer(torch_model, X_background, batch_size=batch_size, device="cpu")
+
+    assert np.allclose(on_device.shapley_values(X_instances), on_host.shapley_values(X_instances))
+
+
+
+@pytest.mark.parametrize("method", ["kernel", "permutation"])
+def test_sampling_methods_reject_non_positive_n_samples(background_and_instances, method):
+    """Sampling zero coalitions or orderings is an error, not a silent estimate."""
+    X_background, X_instances = background_and_instances
+    explainer = ShapleyExplainer(lambda X: X.sum(axis=1), X_background)
+
+    with pytest.raises(ValueError, match="n_samples"):
+        explainer.shapley_values(X_instances, method=method, n_samples=0)